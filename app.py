@@ -1,5 +1,4 @@
 import streamlit as st
-import base64
 from mistralai import Mistral
 from mistralai.extra import response_format_from_pydantic_model
 from scheamas.v2.schemas import ProductInfo, basic_annotation_schema, full_annotation_schema
@@ -9,23 +8,44 @@ st.title("🛍️ Product OCR & Annotation Visualizer")
 st.markdown("Upload one or more product images. The app extracts structured details and annotations using Mistral OCR.")
 
 # --- Helper functions ---
-def encode_file(file_bytes):
-    """Encode bytes into base64 for OCR API."""
-    return base64.b64encode(file_bytes).decode("utf-8")
+# The cache is shared by every session on the server, so bound it: each
+# cached client holds open connection pools, and stale or mistyped keys
+# should not keep theirs alive forever.
+@st.cache_resource(show_spinner=False, max_entries=16, ttl=3600)
+def get_client(api_key: str) -> Mistral:
+    """Build one Mistral client per API key and reuse it across reruns."""
+    return Mistral(api_key=api_key)
 
-def analyze_image(api_key, image_data, mime_type):
-    """Call Mistral OCR for a single image."""
+@st.cache_resource(show_spinner=False)
+def get_response_format():
+    """Build the annotation response format once instead of per image."""
+    return response_format_from_pydantic_model(full_annotation_schema)
+
+def analyze_image(api_key, file_name, content):
+    """Upload an image (bytes or binary file object) and call Mistral OCR on its signed URL."""
     try:
-        client = Mistral(api_key=api_key)
-        payload = {
-            "type": "image_url",
-            "image_url": f"data:{mime_type};base64,{image_data}"
-        }
-        response = client.ocr.process(
-            model="mistral-ocr-latest",
-            document=payload,
-            document_annotation_format=response_format_from_pydantic_model(full_annotation_schema)
+        client = get_client(api_key)
+        upload = client.files.upload(
+            file={"file_name": file_name, "content": content},
+            purpose="ocr"
         )
+        try:
+            signed = client.files.get_signed_url(file_id=upload.id, expiry=1)
+            payload = {
+                "type": "image_url",
+                "image_url": signed.url
+            }
+            response = client.ocr.process(
+                model="mistral-ocr-latest",
+                document=payload,
+                document_annotation_format=get_response_format()
+            )
+        finally:
+            # Don't leave the user's images behind in their Mistral file storage
+            try:
+                client.files.delete(file_id=upload.id)
+            except Exception as e:
+                st.warning(f"Could not delete uploaded file {file_name}: {e}")
         return response.document_annotation
     except Exception as e:
         st.error(f"Error processing image: {e}")
@@ -42,7 +62,7 @@ def display_results(annotation_json, filename):
 
 
         with st.expander("Show Raw JSON"):
-            st.json(annotation_json)
+            st.code(result.model_dump_json(indent=2), language="json")
     except Exception as e:
         st.error(f"Parsing error: {e}")
         st.text_area("Raw response", annotation_json)
@@ -57,7 +77,9 @@ if uploaded_files and st.button("Start Analysis"):
     else:
         for uploaded_file in uploaded_files:
             with st.spinner(f"Analyzing {uploaded_file.name}..."):
-                encoded = encode_file(uploaded_file.getvalue())
-                result_str = analyze_image(api_key, encoded, uploaded_file.type)
+                # UploadedFile is a BytesIO; hand it to the SDK as-is rather
+                # than copying its contents out with getvalue()
+                uploaded_file.seek(0)
+                result_str = analyze_image(api_key, uploaded_file.name, uploaded_file)
                 if result_str:
                     display_results(result_str, uploaded_file.name)
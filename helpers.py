@@ -1,109 +1,134 @@
 # helpers.py
+import asyncio
+import io
 import os
 import re
 import logging
+import threading
 from typing import Any, Dict, Optional, List, Tuple
 from PIL import Image, ImageDraw
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import from_json
 from scheamas.v0.schemas import ProductInfo
 from mistralai import Mistral
 
 logger = logging.getLogger(__name__)
 
+_PRODUCT_TA = TypeAdapter(ProductInfo)
+
+# One alternative per field, each wrapped in a lookahead so a single
+# finditer pass reports every field (matches may overlap, e.g. a flavour
+# value running into a price) at the leftmost position it occurs.
+# Separators are written as ``\s*(?:[:\-]\s*)?`` rather than
+# ``\s*[:\-]?\s*`` so a long whitespace run that fails to match cannot be
+# split between two adjacent ``\s*`` in quadratically many ways.
+_FIELD_PATTERNS = [
+    # (anchor, leading keywords, rest of the pattern)
+    # "key: value" prefix heuristics, anchored to the start of the line
+    ("^", ("product name", "name of product"), r"[^:]*:(?P<product_name>.*)"),
+    ("^", ("brand",), r"[^:]*:(?P<brand>.*)"),
+    ("^", ("manufactured by", "produced by"), r"[^:]*:(?P<manufacturer>.*)"),
+    ("^", ("origin country", "originated from"), r"[^:]*:(?P<origin_country>.*)"),
+    ("^", ("ingredients",), r"[^:]*:(?P<ingredients>.*)"),
+    # inline values
+    ("", ("price", "mrp"), r"\s*(?:[:\-]\s*)?(?P<price>[₹$]\s?\d+[.,]?\d*)"),
+    (r"\b", ("weight",), r"\s*(?:[:\-]\s*)?(?P<weight>\d+(?:\.\d+)?\s*(?:g|kg|ml|l))\b"),
+    (r"\b", ("size",), r"\s*(?:[:\-]\s*)?(?P<size>\d+(?:\.\d+)?\s*(?:cm|mm|inch|in))\b"),
+    # the flavour value can run over later keywords on the line, so only its
+    # start is found here and _FIELD_VALUE_RES reads it (see below)
+    (r"\b", ("flavour",), r"\s*(?:[:\-]\s*)?(?P<flavour>)(?=[A-Za-z ])"),
+    (r"\b", ("item",), r"[s]?\s*count\s*(?:[:\-]\s*)?(?P<item_count>\d+)"),
+    (r"\b", ("no",), r"(?:\.| of)?\s*pack(?:s)?\s*(?:[:\-]\s*)?(?P<no_of_packs>\d+)"),
+]
+# Every match starts with one of the keywords, so testing their first
+# letters as a character class before the alternation lets the engine
+# reject most positions with a single table lookup instead of trying each
+# alternative in turn. The gate is what makes the fused scanner pay off:
+# without it, trying every lookahead at every position is slower than
+# running the field patterns as separate searches.
+_FIELD_FIRST_CHARS = "".join(sorted({kw[0].lower() for _, keywords, _ in _FIELD_PATTERNS for kw in keywords}))
+_FIELD_RE = re.compile(
+    f"(?=[{re.escape(_FIELD_FIRST_CHARS)}])(?:"
+    + "|".join(
+        f"(?={anchor}(?:{'|'.join(map(re.escape, keywords))}){rest})"
+        for anchor, keywords, rest in _FIELD_PATTERNS
+    )
+    + ")",
+    re.IGNORECASE,
+)
+# Values that would make the scanner quadratic if captured inside its
+# lookahead: the scanner reports every occurrence of a keyword, and each
+# one would rescan to the end of the line. These are read from the group's
+# position only while the field is still missing.
+_FIELD_VALUE_RES = {
+    "flavour": re.compile(r"[A-Za-z ]+", re.IGNORECASE),
+}
+# Prefix fields keep the last occurrence; everything else keeps the first.
+_LAST_WINS_FIELDS = frozenset({"product_name", "brand", "manufacturer", "origin_country"})
+
 def _parse_markdown_text(text: str) -> Dict[str, Any]:
     result: Dict[str, Any] = {}
-    lines = text.splitlines()
-    for l in lines:
+    # Hot loop: bind lookups to locals once rather than per line
+    finditer = _FIELD_RE.finditer
+    for l in text.splitlines():
         line = l.strip()
-        lower = line.lower()
-        # product name heuristics
-        if lower.startswith("product name") or lower.startswith("name of product"):
-            parts = line.split(":", 1)
-            if len(parts) == 2:
-                result["product_name"] = parts[1].strip()
-        # brand
-        if lower.startswith("brand"):
-            parts = line.split(":", 1)
-            if len(parts) == 2:
-                result["brand"] = parts[1].strip()
-        # manufacturer / produced by
-        if lower.startswith("manufactured by") or lower.startswith("produced by"):
-            parts = line.split(":", 1)
-            if len(parts) == 2:
-                result["manufacturer"] = parts[1].strip()
-        # origin country
-        if lower.startswith("origin country") or lower.startswith("originated from"):
-            parts = line.split(":", 1)
-            if len(parts) == 2:
-                result["origin_country"] = parts[1].strip()
-        # price
-        m = re.search(r"(?:price|mrp)\s*[:\-]?\s*([₹$]\s?\d+[.,]?\d*)", line, re.IGNORECASE)
-        if m and "price" not in result:
-            result["price"] = m.group(1).strip()
-        # weight
-        m = re.search(r"\bweight\s*[:\-]?\s*(\d+(?:\.\d+)?\s*(?:g|kg|ml|l))\b", line, re.IGNORECASE)
-        if m and "weight" not in result:
-            result["weight"] = m.group(1).strip()
-        # size
-        m = re.search(r"\bsize\s*[:\-]?\s*(\d+(?:\.\d+)?\s*(?:cm|mm|inch|in))\b", line, re.IGNORECASE)
-        if m and "size" not in result:
-            result["size"] = m.group(1).strip()
-        # ingredients
-        if lower.startswith("ingredients"):
-            parts = line.split(":", 1)
-            if len(parts) == 2 and "ingredients" not in result:
-                result["ingredients"] = parts[1].strip()
+        if not line:
+            continue
+        for m in finditer(line):
+            key = m.lastgroup
+            if key in _LAST_WINS_FIELDS:
+                result[key] = m.group(key).strip()
+            elif key not in result:
+                value_re = _FIELD_VALUE_RES.get(key)
+                if value_re is not None:
+                    value = value_re.match(line, m.end(key)).group()
+                else:
+                    value = m.group(key)
+                result[key] = value.strip()
         # dietary flags
+        lower = line.lower()
         if "halal" in lower and ("yes" in lower or "certified" in lower):
             result["halal"] = True
         if "gluten free" in lower or "gluten-free" in lower:
             result["gluten_free"] = True
-        # flavour
-        m = re.search(r"\bflavour\s*[:\-]?\s*([A-Za-z ]+)", line, re.IGNORECASE)
-        if m and "flavour" not in result:
-            result["flavour"] = m.group(1).strip()
-        # item count / no of packs
-        m = re.search(r"\bitem[s]?\s*count\s*[:\-]?\s*(\d+)", line, re.IGNORECASE)
-        if m and "item_count" not in result:
-            result["item_count"] = m.group(1).strip()
-        m = re.search(r"\bno(?:\.| of)?\s*pack(?:s)?\s*[:\-]?\s*(\d+)", line, re.IGNORECASE)
-        if m and "no_of_packs" not in result:
-            result["no_of_packs"] = m.group(1).strip()
     return result
 
 def extract_product_info_from_ocr(ocr_response: Any) -> ProductInfo:
-    extracted: Dict[str, Any] = {}
+    # Sources in decreasing priority: a key from an earlier source is never
+    # overridden by a later one.
+    annotation: Dict[str, Any] = {}
+    bbox_fields: Dict[str, Any] = {}
+    heuristics: Dict[str, Any] = {}
     # If structured annotation supported
     if hasattr(ocr_response, "document_annotation") and ocr_response.document_annotation:
-        extracted.update(ocr_response.document_annotation)
+        annotation = ocr_response.document_annotation
+        # The OCR API returns structured annotations as a JSON string
+        if isinstance(annotation, (str, bytes)):
+            annotation = from_json(annotation)
     # If bbox_annotation supported
     if hasattr(ocr_response, "bbox_annotation") and ocr_response.bbox_annotation:
         if isinstance(ocr_response.bbox_annotation, dict):
-            for k, v in ocr_response.bbox_annotation.items():
-                if k not in extracted:
-                    extracted[k] = v
+            bbox_fields = ocr_response.bbox_annotation
         elif isinstance(ocr_response.bbox_annotation, list):
             for item in ocr_response.bbox_annotation:
                 key = item.get("key")
                 val = item.get("value")
-                if key and val and key not in extracted:
-                    extracted[key] = val
+                if key and val and key not in bbox_fields:
+                    bbox_fields[key] = val
     # Fallback to markdown
     if hasattr(ocr_response, "pages"):
         full_text = "\n".join(
             page.markdown for page in ocr_response.pages if hasattr(page, "markdown")
         )
         heuristics = _parse_markdown_text(full_text)
-        for k, v in heuristics.items():
-            if k not in extracted:
-                extracted[k] = v
+    extracted: Dict[str, Any] = {**heuristics, **bbox_fields, **annotation}
     logger.info("Extracted data keys: %s", list(extracted.keys()))
+    # Unknown keys are dropped by ProductInfo's extra="ignore" config
     try:
-        product_info = ProductInfo(**extracted)
-    except Exception as e:
+        return _PRODUCT_TA.validate_python(extracted)
+    except ValidationError as e:
         logger.warning("Validation error building ProductInfo: %s — data: %s", e, extracted)
-        valid = {k: v for k, v in extracted.items() if k in ProductInfo.__fields__}
-        product_info = ProductInfo(**valid)
-    return product_info
+        raise
 
 def draw_bounding_boxes_on_image(image: Image.Image, ocr_response: Any) -> Image.Image:
     img = image.copy()
@@ -124,13 +149,23 @@ def draw_bounding_boxes_on_image(image: Image.Image, ocr_response: Any) -> Image
                 draw.rectangle(coords, outline="blue", width=2)
     return img
 
+def _read_file(image_path: str) -> bytes:
+    with open(image_path, "rb") as f:
+        return f.read()
+
+def _build_results(content: bytes, ocr_response: Any) -> Tuple[ProductInfo, Image.Image]:
+    info = extract_product_info_from_ocr(ocr_response)
+    orig_img = Image.open(io.BytesIO(content))
+    orig_img.load()
+    annotated_img = draw_bounding_boxes_on_image(orig_img, ocr_response)
+    return info, annotated_img
+
 def process_image_file(image_path: str,
                        client: Mistral,
                        model_name: str,
                        annotation_schema: Optional[Dict] = None) -> Tuple[Optional[ProductInfo], Optional[Image.Image], Optional[str]]:
     try:
-        with open(image_path, "rb") as f:
-            content = f.read()
+        content = _read_file(image_path)
         upload = client.files.upload(
             file={
                 "file_name": os.path.basename(image_path),
@@ -152,32 +187,118 @@ def process_image_file(image_path: str,
             # If you have annotation schema support, you could pass:
             # document_annotation_format=annotation_schema
         )
-        info = extract_product_info_from_ocr(response)
-        orig_img = Image.open(image_path)
-        annotated_img = draw_bounding_boxes_on_image(orig_img, response)
+        info, annotated_img = _build_results(content, response)
         return info, annotated_img, None
     except Exception as e:
         logger.error("Error processing %s: %s", image_path, e)
         return None, None, str(e)
 
+async def process_image_file_async(image_path: str,
+                                   client: Mistral,
+                                   model_name: str,
+                                   annotation_schema: Optional[Dict] = None) -> Tuple[Optional[ProductInfo], Optional[Image.Image], Optional[str]]:
+    """Async counterpart of process_image_file using the client's *_async endpoints.
+
+    The client's async connection pool is tied to the event loop it first
+    ran on, so a given client should only ever be awaited from one loop.
+    """
+    try:
+        # File I/O, image decoding and box drawing block, so keep them off the loop
+        content = await asyncio.to_thread(_read_file, image_path)
+        upload = await client.files.upload_async(
+            file={
+                "file_name": os.path.basename(image_path),
+                "content": content
+            },
+            purpose="ocr"
+        )
+        signed = await client.files.get_signed_url_async(file_id=upload.id, expiry=24)
+        url = signed.url
+        logger.info("Uploaded and got signed URL: %s", url)
+        response = await client.ocr.process_async(
+            model=model_name,
+            document={
+                "type": "document_url",
+                "document_url": url
+            },
+            include_image_base64=False,
+        )
+        info, annotated_img = await asyncio.to_thread(_build_results, content, response)
+        return info, annotated_img, None
+    except Exception as e:
+        logger.error("Error processing %s: %s", image_path, e)
+        return None, None, str(e)
+
+async def _process_batch_images_async(image_paths: List[str],
+                                      client: Mistral,
+                                      model_name: str,
+                                      annotation_schema: Optional[Dict],
+                                      max_workers: int) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run_one(path: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                info, annotated_img, error = await process_image_file_async(path, client, model_name, annotation_schema)
+                return {"path": path, "info": info, "annotated_img": annotated_img, "error": error}
+            except Exception as exc:
+                logger.error("Unhandled exception for %s: %s", path, exc)
+                return {"path": path, "info": None, "annotated_img": None, "error": str(exc)}
+
+    return list(await asyncio.gather(*(run_one(path) for path in image_paths)))
+
+# Every batch runs on this one long-lived loop. The Mistral client pools its
+# async connections on the loop they were opened on, so a fresh loop per
+# batch (asyncio.run) breaks reuse of a shared client with
+# "Event loop is closed".
+_batch_loop: Optional[asyncio.AbstractEventLoop] = None
+_batch_loop_lock = threading.Lock()
+
+def _get_batch_loop() -> asyncio.AbstractEventLoop:
+    global _batch_loop
+    with _batch_loop_lock:
+        if _batch_loop is None:
+            _batch_loop = asyncio.new_event_loop()
+            threading.Thread(target=_batch_loop.run_forever, name="ocr-batch-loop", daemon=True).start()
+        return _batch_loop
+
+def _on_batch_loop() -> bool:
+    try:
+        return asyncio.get_running_loop() is _batch_loop
+    except RuntimeError:
+        return False
+
 def process_batch_images(image_paths: List[str],
                          client: Mistral,
                          model_name: str,
                          annotation_schema: Optional[Dict] = None,
                          max_workers: int = 4) -> List[Dict[str, Any]]:
-    import concurrent.futures
-    results: List[Dict[str, Any]] = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(process_image_file, path, client, model_name, annotation_schema): path
-            for path in image_paths
-        }
-        for future in concurrent.futures.as_completed(futures):
-            path = futures[future]
-            try:
-                info, annotated_img, error = future.result()
-                results.append({"path": path, "info": info, "annotated_img": annotated_img, "error": error})
-            except Exception as exc:
-                logger.error("Unhandled exception for %s: %s", path, exc)
-                results.append({"path": path, "info": None, "annotated_img": None, "error": str(exc)})
-    return results
+    """Process images concurrently over the single shared client.
+
+    At most ``max_workers`` requests are in flight at once. Results are
+    returned in the same order as ``image_paths``. Safe to call repeatedly
+    with the same client. The call blocks the calling thread until the
+    whole batch is done; from async code use process_batch_images_async.
+    """
+    if _on_batch_loop():
+        raise RuntimeError("process_batch_images would deadlock on the batch loop; await process_batch_images_async instead")
+    future = asyncio.run_coroutine_threadsafe(
+        _process_batch_images_async(image_paths, client, model_name, annotation_schema, max_workers),
+        _get_batch_loop(),
+    )
+    return future.result()
+
+async def process_batch_images_async(image_paths: List[str],
+                                     client: Mistral,
+                                     model_name: str,
+                                     annotation_schema: Optional[Dict] = None,
+                                     max_workers: int = 4) -> List[Dict[str, Any]]:
+    """Awaitable form of process_batch_images that does not block the caller's loop.
+
+    The batch still runs on the shared batch loop, so the client keeps
+    seeing a single event loop.
+    """
+    coro = _process_batch_images_async(image_paths, client, model_name, annotation_schema, max_workers)
+    if _on_batch_loop():
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _get_batch_loop()))
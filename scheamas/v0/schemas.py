@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 
 
@@ -38,6 +38,8 @@ class BasicAnnotationSchema(BaseModel):
 
 class ProductInfo(BaseModel):
     """Structured representation of all extracted product data from an image."""
+    model_config = ConfigDict(extra="ignore", populate_by_name=True)
+
     product_name: str = Field(..., description="Extract the most prominent, primary name of the product from the front of the package.")
     brand: Optional[str] = Field(None, description="Identify and extract the brand name, which is often a logo or located near the product name.")
     flavor: Optional[str] = Field(None, description="Extract the specific flavor of the product if it is mentioned (e.g., 'Chocolate Chip', 'Lemon Lime').")
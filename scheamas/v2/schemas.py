@@ -1,5 +1,11 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+import numpy as np
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Dict, List, Optional
+
+# Shared by every model below: instances are never mutated after parsing,
+# unknown keys from the OCR response are dropped, and whitespace is
+# stripped by pydantic-core during validation.
+_MODEL_CONFIG = ConfigDict(frozen=True, extra="ignore", str_strip_whitespace=True)
 
 # --- NEW: Multilingual String Model ---
 class LangString(BaseModel):
@@ -7,12 +13,22 @@ class LangString(BaseModel):
     Represents a string value that may exist in multiple languages.
     At least one language field should be populated.
     """
+    model_config = _MODEL_CONFIG
     en: Optional[str] = Field(None, description="The extracted text in English.")
     ar: Optional[str] = Field(None, description="The extracted text in Arabic.")
 
+    def text(self) -> Optional[str]:
+        """Return the English text, falling back to Arabic."""
+        return self.en or self.ar
+
+
+def _lang_text(value: Optional[LangString]) -> Optional[str]:
+    return value.text() if value is not None else None
+
 
 class Nutrient(BaseModel):
     """Represents a single nutrient row from the nutrition facts table."""
+    model_config = _MODEL_CONFIG
     name: LangString = Field(..., description="Extract the name of the nutrient (e.g., 'Total Fat', 'Sodium', 'Sugars') in English and Arabic.")
     quantity: Optional[float] = Field(None, description="Extract only the numerical value of the nutrient's quantity (e.g., for '10g', extract 10).")
     unit: Optional[LangString] = Field(None, description="Extract the unit of measurement for the nutrient (e.g., 'g', 'mg', 'kcal') in English and Arabic.")
@@ -20,24 +36,28 @@ class Nutrient(BaseModel):
 
 class Ingredient(BaseModel):
     """Represents an individual ingredient from the ingredients list."""
+    model_config = _MODEL_CONFIG
     name: LangString = Field(..., description="Extract the name of a single ingredient (e.g., 'Enriched Flour', 'Palm Oil') in English and Arabic.")
     quantity: Optional[LangString] = Field(None, description="If a quantity or percentage is listed next to an ingredient, extract it as a string (e.g., '5%') in English and Arabic.")
     is_allergen: bool = Field(False, description="Set to true if this ingredient is highlighted, in bold, or explicitly listed in an allergen warning.")
 
 class Dimensions(BaseModel):
     """Represents the physical dimensions of the product packaging, if mentioned."""
+    model_config = _MODEL_CONFIG
     length: Optional[float] = Field(None, description="Extract the numerical value for the package's length, if specified.")
     width: Optional[float] = Field(None, description="Extract the numerical value for the package's width, if specified.")
     height: Optional[float] = Field(None, description="Extract the numerical value for the package's height, if specified.")
-    unit: Optional[LangString] = Field("cm", description="Extract the unit of measurement for the dimensions (e.g., 'cm', 'in', 'mm') in English and Arabic.")
+    unit: Optional[LangString] = Field(LangString(en="cm"), description="Extract the unit of measurement for the dimensions (e.g., 'cm', 'in', 'mm') in English and Arabic.")
 
 class ProductContent(BaseModel):
     """Represents the net weight or volume of the product."""
+    model_config = _MODEL_CONFIG
     value: float = Field(..., description="Extract the numerical value of the product's net weight or volume (e.g., from 'NET WT 500 g', extract 500).")
     unit: LangString = Field(..., description="Extract the unit of the product's net weight or volume (e.g., 'g', 'kg', 'ml', 'L', 'oz') in English and Arabic.")
 
 class BasicAnnotationSchema(BaseModel):
     """Represents a bounding box for a detected text or object."""
+    model_config = _MODEL_CONFIG
     x: int = Field(..., description="The x-coordinate of the top-left corner of the bounding box.")
     y: int = Field(..., description="The y-coordinate of the top-left corner of the bounding box.")
     width: int = Field(..., description="The width of the bounding box in pixels.")
@@ -47,6 +67,7 @@ class BasicAnnotationSchema(BaseModel):
 
 class ProductInfo(BaseModel):
     """Structured representation of all extracted product data from an image."""
+    model_config = _MODEL_CONFIG
     product_name: LangString = Field(..., description="Extract the most prominent, primary name of the product in English and Arabic.")
     brand: Optional[LangString] = Field(None, description="Identify and extract the brand name in English and Arabic.")
     flavor: Optional[LangString] = Field(None, description="Extract the specific flavor of the product if it is mentioned (e.g., 'Chocolate Chip', 'Lemon Lime') in English and Arabic.")
@@ -79,9 +100,32 @@ class ProductInfo(BaseModel):
     expiration_date: Optional[str] = Field(None, description="Find and extract the expiration date, which may be labeled as 'Best By', 'Use By', or 'EXP'.")
     batch_number: Optional[str] = Field(None, description="Find and extract the production lot or batch number, often labeled 'Lot No.' or 'Batch'.")
 
+    def nutrient_columns(self) -> Dict[str, Any]:
+        """
+        Return the nutrition facts table as columns rather than rows.
+        Numeric columns are float arrays with NaN where a value is missing.
+        """
+        rows = self.nutrition_facts or []
+        return {
+            "names": [_lang_text(n.name) for n in rows],
+            "quantities": np.fromiter((np.nan if n.quantity is None else n.quantity for n in rows), dtype=float, count=len(rows)),
+            "units": [_lang_text(n.unit) for n in rows],
+            "dv": np.fromiter((np.nan if n.daily_value_percent is None else n.daily_value_percent for n in rows), dtype=float, count=len(rows)),
+        }
+
+    def ingredient_columns(self) -> Dict[str, Any]:
+        """Return the ingredients list as columns rather than rows."""
+        rows = self.ingredients or []
+        return {
+            "names": [_lang_text(i.name) for i in rows],
+            "quantities": [_lang_text(i.quantity) for i in rows],
+            "is_allergen": np.fromiter((i.is_allergen for i in rows), dtype=bool, count=len(rows)),
+        }
+
 
 class FullAnnotationSchema(BaseModel):
     """The complete schema for an annotated image, containing image metadata and extracted product details."""
+    model_config = _MODEL_CONFIG
     image_id: str = Field(..., description="A unique identifier for the image file.")
     product_details: ProductInfo = Field(..., description="A nested object containing all extracted product details.")
 
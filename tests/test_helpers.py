@@ -0,0 +1,44 @@
+import time
+
+import pytest
+
+from helpers import _parse_markdown_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    (
+        "Product Name: Choco Bar\nBrand: Acme\nMRP: ₹ 120.50 incl. taxes\nNet weight: 500 g\nIngredients: sugar, cocoa",
+        {"product_name": "Choco Bar", "brand": "Acme", "price": "₹ 120.50", "weight": "500 g", "ingredients": "sugar, cocoa"},
+    ),
+    # prefix fields keep the last occurrence, everything else the first
+    (
+        "Brand: First\nBrand: Second\nIngredients: a\nIngredients: b\nPrice $1\nPrice $2",
+        {"brand": "Second", "ingredients": "a", "price": "$1"},
+    ),
+    # several fields on one line, with the flavour value running into a price
+    (
+        "Flavour: Mint price $3 weight 2kg size 10 cm",
+        {"flavour": "Mint price", "price": "$3", "weight": "2kg", "size": "10 cm"},
+    ),
+    (
+        "Halal certified\nGluten-Free\nHalal",
+        {"halal": True, "gluten_free": True},
+    ),
+    (
+        "items count: 6\nNo of packs 3\nflavour   1",
+        {"item_count": "6", "no_of_packs": "3", "flavour": ""},
+    ),
+    ("Store in a cool, dry place.\n\n| Sodium | 230mg |", {}),
+])
+def test_parse_markdown_text(text, expected):
+    assert _parse_markdown_text(text) == expected
+
+
+def test_parse_markdown_text_repeated_keyword_line_is_linear():
+    # Every "flavour" here starts a match whose value runs to the end of the
+    # line; scanning each one again used to take seconds on a 64 KB line.
+    line = "flavour " * 8000
+    start = time.perf_counter()
+    result = _parse_markdown_text(line)
+    assert time.perf_counter() - start < 0.5
+    assert result == {"flavour": line.strip()[len("flavour "):]}